@@ -10,18 +10,25 @@ from textual.widgets import Static, Button, TextArea, Footer, Select, Label
 from textual.containers import Vertical, Horizontal, ScrollableContainer
 from textual import work
 from rich.text import Text
-import pyperclip
-import traceback
 import re
 import os
-import datetime
+import time
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     from .debugger import (
         scan,
         run_in_sandbox,
+        decode_output,
         build_prompt,
         ask_ollama,
+        ask_ollama_stream,
+        ask_ollama_ping,
+        build_fix_explain_prompt,
+        parse_fix_explain,
         extract_unified_diff,
         apply_patch,
     )
@@ -29,16 +36,23 @@ except ImportError:
     from debugger import (
         scan,
         run_in_sandbox,
+        decode_output,
         build_prompt,
         ask_ollama,
+        ask_ollama_stream,
+        ask_ollama_ping,
+        build_fix_explain_prompt,
+        parse_fix_explain,
         extract_unified_diff,
         apply_patch,
     )
 
 # ── Settings ──────────────────────────────────────────────────────────────────
 import tomli as _tomli
+from functools import lru_cache
 import sys
 
+@lru_cache(maxsize=1)
 def _load_cfg():
     """Load configuration from package resources or local file."""
     if sys.version_info >= (3, 9):
@@ -58,6 +72,12 @@ def _load_cfg():
     except Exception:
         return {}
 
+@lru_cache(maxsize=1)
+def _clipboard():
+    """(copy, paste) for the detected clipboard backend, probed once on first use."""
+    import pyperclip
+    return pyperclip.determine_clipboard()
+
 # ── Logo ──────────────────────────────────────────────────────────────────────
 LOGO = [
     "██████╗ ██████╗ ██████╗ ███████╗███████╗██╗██╗  ██╗     ██████╗██╗     ██╗",
@@ -77,20 +97,30 @@ LANGUAGES = [
 ]
 
 MAX_HISTORY = 5
+MAX_HISTORY_BYTES = 512 * 1024
+MAX_ANALYSIS_CACHE = 8
+
+# Rich markup tags, stripped before copying/saving output
+_MARKUP_RE = re.compile(r"\[/?[a-zA-Z0-9_ #/=]+\]")
+# Minimum seconds between output repaints while an LLM reply streams in (~30 Hz)
+_STREAM_INTERVAL = 1 / 30
+
+_TAIL = 4000  # max bytes of program output shown in the panel
+
+def _tail(s) -> str:
+    """Keep only the last _TAIL bytes, decoding just that slice of raw sandbox output."""
+    # The cut can land mid-character; that decodes as a leading U+FFFD
+    if len(s) <= _TAIL:
+        return decode_output(s)
+    return "…[truncated]…\n" + decode_output(s[-_TAIL:])
+
+def _plain(out) -> str:
+    """Unstyled form of a panel output, for the clipboard and saved files."""
+    return out.plain if isinstance(out, Text) else _MARKUP_RE.sub("", out)
 
 # ── Logo widget ───────────────────────────────────────────────────────────────
-class LogoWidget(Static):
-    """Widget for displaying the application logo."""
-    def render(self):
-        t = Text()
-        for line in LOGO:
-            for char in line:
-                if char != ' ':
-                    t.append(char, style="bold #9370db")
-                else:
-                    t.append(char)
-            t.append("\n")
-        return t
+# One style span over the whole block; spaces carry no visible colour anyway
+_LOGO_TEXT = Text("\n".join(LOGO) + "\n", style="bold #9370db")
 
 
 # ── Main app ──────────────────────────────────────────────────────────────────
@@ -197,16 +227,29 @@ class CodeFixApp(App):
     """
 
     # ── State ─────────────────────────────────────────────────────────────────
-    _history: list[str] = []
     _hist_idx: int = -1
-    _last_output: str = ""
+    _last_output = ""  # markup str or Text
+    _last_status: str = ""
+    _shown_output = None
     _current_lang: str = "python"
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._history: deque = deque()
+        self._history_hashes: set = set()
+        self._history_bytes: int = 0
+        # Actions whose worker is still running
+        self._busy: set = set()
+        # blake2b(code) -> (ast_res, run_res), least recently used first
+        self._analysis_cache: OrderedDict = OrderedDict()
+        # Sandbox runs off the worker thread so scan() can overlap with it
+        self._pool = ThreadPoolExecutor(max_workers=2)
+
     def compose(self) -> ComposeResult:
         cfg = _load_cfg()
         model = cfg.get("model", "qwen2.5-coder:0.5b")
 
-        yield LogoWidget(id="logo")
+        yield Static(_LOGO_TEXT, id="logo")
         yield Static("✨ CODEFIX CLI v2.0 ✨", id="subtitle")
         yield Static("━━━━━ Paste code → Analyze / Fix / Explain ━━━━━", id="info")
 
@@ -231,6 +274,7 @@ class CodeFixApp(App):
             yield Button("Analyze",      id="analyze",      variant="primary")
             yield Button("Fix",          id="fix",          variant="success")
             yield Button("Explain",      id="explain",      variant="default")
+            yield Button("Fix & Explain", id="fix_explain", variant="success")
             yield Button("Copy Output",  id="copy_output",  variant="default")
             yield Button("Save",         id="save",         variant="default")
             yield Button("Paste",        id="paste",        variant="default")
@@ -244,30 +288,81 @@ class CodeFixApp(App):
         yield footer
 
     def on_mount(self) -> None:
+        self._input  = self.query_one("#input", TextArea)
+        self._output = self.query_one("#output", Static)
+        self._status = self.query_one("#status_bar", Static)
         self.bind("ctrl+q", "quit", description="Quit")
         self.bind("ctrl+a", "analyze", description="Analyze")
         self.bind("ctrl+f", "fix", description="Fix")
         self.bind("ctrl+e", "explain", description="Explain")
         self.bind("ctrl+c", "copy_output", description="Copy Output")
+        self._warmup()
 
     # ── Helpers ───────────────────────────────────────────────────────────────
     def _set_status(self, msg: str):
         cfg = _load_cfg()
         model = cfg.get("model", "qwen2.5-coder:0.5b")
-        self.query_one("#status_bar", Static).update(f"  Model: {model}  │  {msg}")
+        status = f"  Model: {model}  │  {msg}"
+        if status == self._last_status:
+            return
+        self._last_status = status
+        self._status.update(status)
 
-    def _set_output(self, text: str):
-        self._last_output = text
-        self.query_one("#output", Static).update(text)
+    def _set_output(self, out):
+        self._last_output = out
+        self._show_output(out)
+
+    def _show_output(self, renderable):
+        """Put a renderable in the output panel, skipping the repaint if it is already shown."""
+        if renderable == self._shown_output:
+            return
+        self._shown_output = renderable
+        self._output.update(renderable)
+
+    def _stream_llm(self, prompt: str) -> str:
+        """Stream an LLM reply into the output panel as it arrives; returns the full reply."""
+        # Partial replies are shown as plain Text so half-received tokens
+        # never go through the markup parser.
+        chunks = []
+        last = 0.0
+        for chunk in ask_ollama_stream(prompt):
+            chunks.append(chunk)
+            now = time.monotonic()
+            if now - last >= _STREAM_INTERVAL:
+                last = now
+                self.call_from_thread(self._show_output, Text("".join(chunks)))
+        return "".join(chunks)
+
+    def _analyze(self, code: str):
+        """Scan and sandbox the code, reusing results for any of the last few inputs."""
+        key = hashlib.blake2b(code.encode("utf-8"), digest_size=16).digest()
+        hit = self._analysis_cache.pop(key, None)
+        if hit is None:
+            # The AST walk runs here while the sandbox child starts up
+            fut_run = self._pool.submit(run_in_sandbox, code)
+            hit = scan(code), fut_run.result()
+        self._analysis_cache[key] = hit
+        while len(self._analysis_cache) > MAX_ANALYSIS_CACHE:
+            self._analysis_cache.popitem(last=False)
+        return hit
 
     def _push_history(self, code: str):
         if not code.strip():
             return
-        if self._history and self._history[-1] == code:
+        h = hash(code)
+        if h in self._history_hashes and code in self._history:
+            return
+        size = len(code.encode("utf-8"))
+        if size > MAX_HISTORY_BYTES:
             return
         self._history.append(code)
-        if len(self._history) > MAX_HISTORY:
-            self._history.pop(0)
+        self._history_hashes.add(h)
+        self._history_bytes += size
+        # Bound the buffer by entry count and by total size
+        while len(self._history) > MAX_HISTORY or self._history_bytes > MAX_HISTORY_BYTES:
+            old = self._history.popleft()
+            self._history_hashes.discard(hash(old))
+            self._history_bytes -= len(old.encode("utf-8"))
         self._hist_idx = len(self._history) - 1
 
     # ── Language selector ─────────────────────────────────────────────────────
@@ -275,7 +370,7 @@ class CodeFixApp(App):
         if event.select.id == "lang_select":
             lang = event.value
             self._current_lang = lang
-            ta = self.query_one("#input", TextArea)
+            ta = self._input
             try:
                 if lang:
                     ta.language = lang
@@ -294,22 +389,22 @@ class CodeFixApp(App):
 
         elif bid == "paste":
             try:
-                text = pyperclip.paste()
-                self.query_one("#input", TextArea).text = text
+                text = _clipboard()[1]()
+                self._input.text = text
                 self._set_status("Pasted from clipboard")
             except Exception:
                 self._set_output("[red]Could not paste from clipboard[/red]")
 
         elif bid == "clear":
-            self.query_one("#input", TextArea).text = ""
+            self._input.text = ""
             self._set_output("")
             self._set_status("Cleared")
 
         elif bid == "copy_output":
             if self._last_output:
-                clean = re.sub(r"\[/?[a-zA-Z0-9_ #/=]+\]", "", self._last_output)
+                clean = _plain(self._last_output)
                 try:
-                    pyperclip.copy(clean)
+                    _clipboard()[0](clean)
                     self._set_status("Output copied to clipboard ✓")
                 except Exception:
                     self._set_status("Could not copy — clipboard unavailable")
@@ -317,20 +412,19 @@ class CodeFixApp(App):
         elif bid == "save":
             self._save_output()
 
-        elif bid == "analyze":
-            code = self.query_one("#input", TextArea).text
-            self._push_history(code)
-            self.run_analyze()
-
-        elif bid == "fix":
-            code = self.query_one("#input", TextArea).text
-            self._push_history(code)
-            self.run_fix()
-
-        elif bid == "explain":
-            code = self.query_one("#input", TextArea).text
-            self._push_history(code)
-            self.run_explain()
+        elif bid in ("analyze", "fix", "explain", "fix_explain"):
+            # One run per action at a time; the worker releases it when it ends
+            if bid in self._busy:
+                self._set_status("Still working on the previous request…")
+                return
+            self._busy.add(bid)
+            self._push_history(self._input.text)
+            {
+                "analyze": self.run_analyze,
+                "fix": self.run_fix,
+                "explain": self.run_explain,
+                "fix_explain": self.run_fix_and_explain,
+            }[bid]()
 
         elif bid == "hist_prev":
             self._history_navigate(-1)
@@ -343,50 +437,90 @@ class CodeFixApp(App):
         if not self._history:
             return
         self._hist_idx = max(0, min(len(self._history) - 1, self._hist_idx + direction))
-        self.query_one("#input", TextArea).text = self._history[self._hist_idx]
+        self._input.text = self._history[self._hist_idx]
 
     def _save_output(self):
         if not self._last_output: return
-        clean = re.sub(r"\[/?[a-zA-Z0-9_ #/=]+\]", "", self._last_output)
+        clean = _plain(self._last_output)
+        import datetime
         stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         path = os.path.join(os.path.expanduser("~"), "Desktop", f"codefix_{stamp}.py")
         with open(path, "w") as f: f.write(clean)
         self._set_status(f"Saved to {path}")
 
+    def _warmup(self):
+        # Daemon thread, not @work: Textual joins workers on exit and a cold
+        # model load would hold up Quit until the ping returned
+        def ping():
+            try: ask_ollama_ping()
+            except Exception: pass
+        threading.Thread(target=ping, name="ollama-warmup", daemon=True).start()
+
     @work(thread=True)
     def run_analyze(self):
         self.call_from_thread(self._set_status, "Analyzing…")
         try:
-            code = self.query_one("#input", TextArea).text
-            ast_res  = scan(code)
-            run_res  = run_in_sandbox(code)
-            out = f"[bold]=== ANALYSIS ===[/bold]\n\nAST: {ast_res}\n\nRuntime: {run_res}"
+            code = self._input.text
+            ast_res, run_res = self._analyze(code)
+            # Sandbox streams are raw bytes; decode only the tail that is shown
+            run_view = {k: _tail(v) if k in ("stdout", "stderr") else v
+                        for k, v in run_res.items()}
+            # Text, not markup: the dict reprs are full of [...] Rich would try to parse
+            out = Text.assemble(("=== ANALYSIS ===", "bold"), f"\n\nAST: {ast_res}\n\nRuntime: {run_view}")
             self.call_from_thread(self._set_output, out)
             self.call_from_thread(self._set_status, "Done ✓")
         except Exception as e:
-            self.call_from_thread(self._set_output, str(e))
+            self.call_from_thread(self._set_output, Text(str(e)))
+        finally:
+            self._busy.discard("analyze")
 
     @work(thread=True)
     def run_fix(self):
         self.call_from_thread(self._set_status, "Fixing…")
         try:
-            code = self.query_one("#input", TextArea).text
-            llm_out = ask_ollama(build_prompt(code, scan(code), run_in_sandbox(code)))
-            self.call_from_thread(self._set_output, llm_out)
+            code = self._input.text
+            ast_res, run_res = self._analyze(code)
+            llm_out = self._stream_llm(build_prompt(code, ast_res, run_res))
+            self.call_from_thread(self._set_output, Text(llm_out))
             self.call_from_thread(self._set_status, "Fixed ✓")
         except Exception as e:
-            self.call_from_thread(self._set_output, str(e))
+            self.call_from_thread(self._set_output, Text(str(e)))
+        finally:
+            self._busy.discard("fix")
+
+    @work(thread=True)
+    def run_fix_and_explain(self):
+        self.call_from_thread(self._set_status, "Fixing & explaining…")
+        try:
+            code = self._input.text
+            ast_res, run_res = self._analyze(code)
+            # One round-trip for both answers; leave room for the code and the prose
+            max_tokens = int(_load_cfg().get("max_tokens", 512))
+            llm_out = ask_ollama(
+                build_fix_explain_prompt(code, ast_res, run_res),
+                num_predict=2 * max_tokens,
+                json_format=True,
+            )
+            fixed, explanation = parse_fix_explain(llm_out)
+            self.call_from_thread(self._set_output, Text(f"{fixed}\n\n{explanation}".strip()))
+            self.call_from_thread(self._set_status, "Fixed & explained ✓")
+        except Exception as e:
+            self.call_from_thread(self._set_output, Text(str(e)))
+        finally:
+            self._busy.discard("fix_explain")
 
     @work(thread=True)
     def run_explain(self):
         self.call_from_thread(self._set_status, "Explaining…")
         try:
-            code = self.query_one("#input", TextArea).text
-            llm_out = ask_ollama(f"Explain this code concisely:\n{code}")
-            self.call_from_thread(self._set_output, llm_out)
+            code = self._input.text
+            llm_out = self._stream_llm(f"Explain this code concisely:\n{code}")
+            self.call_from_thread(self._set_output, Text(llm_out))
             self.call_from_thread(self._set_status, "Explained ✓")
         except Exception as e:
-            self.call_from_thread(self._set_output, str(e))
+            self.call_from_thread(self._set_output, Text(str(e)))
+        finally:
+            self._busy.discard("explain")
 
 def main():
     CodeFixApp().run()
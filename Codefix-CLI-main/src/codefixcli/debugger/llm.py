@@ -8,9 +8,18 @@ import tomli as _tomli
 import os
 import requests
 import json
+import re
+from functools import lru_cache
+
+from .sandbox import decode_output
+
+# First fenced code block, and the outermost {...}, in a reply that wasn't clean JSON
+_CODE_FENCE = re.compile(r"```(?:python)?\s*(.*?)```", re.DOTALL)
+_JSON_OBJ = re.compile(r"\{.*\}", re.DOTALL)
 
 import sys
 
+@lru_cache(maxsize=1)
 def _load_settings():
     """Load settings from package resources or local file."""
     if sys.version_info >= (3, 9):
@@ -31,62 +40,197 @@ def _load_settings():
         # If all else fails, return defaults or empty
         return {}
 
-def ask_ollama(prompt: str) -> str:
-    """Send a prompt to the local Ollama instance and return the response text."""
+def _ollama_cli(prompt: str, model: str, timeout: int) -> str:
+    """Run the prompt through the `ollama` binary when the HTTP API is unreachable."""
+    cmd = ["ollama", "run", model]
+
+    proc = subprocess.run(
+        cmd,
+        input=prompt,
+        text=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=timeout,
+    )
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"Ollama error: {proc.stderr}")
+
+    out = proc.stdout or ""
+    out = out.replace("```python", "").replace("```diff", "")
+    out = out.replace("```", "")
+    return out.strip()
+
+def ask_ollama(prompt: str, num_predict: int = None, json_format: bool = False) -> str:
+    """Send a prompt to the local Ollama instance and return the response text.
+
+    num_predict overrides the configured max_tokens; json_format asks Ollama
+    to constrain the reply to a single JSON object.
+    """
     cfg = _load_settings()
     model = cfg.get("model", "qwen2.5Coder:0.5b")
     timeout = int(cfg.get("timeout_sec", 40))
     host = cfg.get("ollama_host", "http://localhost:11434")
     
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": False,
+        "keep_alive": cfg.get("keep_alive", "30m"),
+        "options": {
+            "temperature": cfg.get("temperature", 0.0),
+            "num_predict": num_predict or cfg.get("max_tokens", 512)
+        }
+    }
+    if json_format:
+        payload["format"] = "json"
+
     # Try API method first (more reliable)
+    try:
+        response = requests.post(
+            f"{host}/api/generate",
+            json=payload,
+            timeout=timeout
+        )
+        response.raise_for_status()
+        result = response.json()
+        return result.get("response", "").strip()
+    except requests.exceptions.RequestException:
+        # Fallback to subprocess method
+        return _ollama_cli(prompt, model, timeout)
+
+def ask_ollama_stream(prompt: str):
+    """Like ask_ollama, but yield the response in chunks as Ollama generates it."""
+    cfg = _load_settings()
+    model = cfg.get("model", "qwen2.5Coder:0.5b")
+    timeout = int(cfg.get("timeout_sec", 40))
+    host = cfg.get("ollama_host", "http://localhost:11434")
+
     try:
         response = requests.post(
             f"{host}/api/generate",
             json={
                 "model": model,
                 "prompt": prompt,
-                "stream": False,
+                "stream": True,
+                "keep_alive": cfg.get("keep_alive", "30m"),
                 "options": {
                     "temperature": cfg.get("temperature", 0.0),
                     "num_predict": cfg.get("max_tokens", 512)
                 }
             },
-            timeout=timeout
+            timeout=timeout,
+            stream=True,
         )
         response.raise_for_status()
-        result = response.json()
-        return result.get("response", "").strip()
     except requests.exceptions.RequestException:
-        # Fallback to subprocess method
-        cmd = ["ollama", "run", model]
-
-        proc = subprocess.run(
-            cmd,
-            input=prompt,
-            text=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=timeout,
-        )
+        # The CLI fallback can't stream; hand back the whole reply at once
+        yield _ollama_cli(prompt, model, timeout)
+        return
 
-        if proc.returncode != 0:
-            raise RuntimeError(f"Ollama error: {proc.stderr}")
+    # One JSON object per line: {"response": "<token>", "done": false}
+    with response:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("response"):
+                yield chunk["response"]
+            if chunk.get("done"):
+                break
 
-        out = proc.stdout or ""
-        out = out.replace("```python", "").replace("```diff", "")
-        out = out.replace("```", "")
-        return out.strip()
+def ask_ollama_ping() -> None:
+    """Load the model into memory with a 1-token request so the first real call isn't cold."""
+    cfg = _load_settings()
+    model = cfg.get("model", "qwen2.5Coder:0.5b")
+    timeout = int(cfg.get("timeout_sec", 40))
+    host = cfg.get("ollama_host", "http://localhost:11434")
+
+    # No CLI fallback: a warm-up isn't worth spawning `ollama run` for
+    response = requests.post(
+        f"{host}/api/generate",
+        json={
+            "model": model,
+            "prompt": " ",
+            "stream": False,
+            # Every generate call sends this; Ollama resets it per request
+            "keep_alive": cfg.get("keep_alive", "30m"),
+            "options": {"num_predict": 1},
+        },
+        # Give up quickly if nothing is listening; loading the model may take a while
+        timeout=(2, timeout),
+    )
+    response.raise_for_status()
+
+def _trunc(s, head: int = 4096, tail: int = 2048) -> str:
+    # Sandbox output arrives as bytes; only the kept slices get decoded
+    if len(s) <= head + tail:
+        return decode_output(s)
+    unit = "bytes" if isinstance(s, bytes) else "chars"
+    return f"{decode_output(s[:head])}\n…[{len(s) - head - tail} {unit} truncated]…\n{decode_output(s[-tail:])}"
+
+def _clip_streams(runtime_data: dict) -> dict:
+    # A runaway print loop shouldn't turn into a megabyte prompt
+    return {k: _trunc(v) if k in ("stdout", "stderr") and isinstance(v, (str, bytes)) else v
+            for k, v in runtime_data.items()}
+
+def _dump(data: dict) -> str:
+    # JSON is both cheaper to produce than repr() and fewer tokens for the model
+    return json.dumps(data, default=str, ensure_ascii=False)
 
 def build_prompt(code: str, ast_data: dict, runtime_data: dict) -> str:
     """Build a detailed prompt for the LLM based on the code and mode."""
-    return (
-        "You are CODEFIX. Generate ONLY a unified diff patch.\n"
-        "No explanations. No comments. No markdown.\n\n"
-        "CODE:\n"
-        f"{code}\n\n"
-        "AST ANALYSIS:\n"
-        f"{ast_data}\n\n"
-        "RUNTIME ANALYSIS:\n"
-        f"{runtime_data}\n\n"
-        "Return ONLY unified diff patch:"
-    )
+    return "\n".join((
+        "You are CODEFIX. Generate ONLY a unified diff patch.",
+        "No explanations. No comments. No markdown.",
+        "",
+        "CODE:", code, "",
+        "AST ANALYSIS:", _dump(ast_data), "",
+        "RUNTIME ANALYSIS:", _dump(_clip_streams(runtime_data)), "",
+        "Return ONLY unified diff patch:",
+    ))
+
+def build_fix_code_prompt(code: str, ast_data: dict, runtime_data: dict) -> str:
+    """Build a prompt asking for the corrected code only, no diff or prose."""
+    return "\n".join((
+        "You are an expert Python debugger. Fix all bugs in the code below.",
+        "Return ONLY the corrected Python code, nothing else.",
+        "",
+        "CODE:", code, "",
+        "AST ANALYSIS:", _dump(ast_data), "",
+        "RUNTIME ANALYSIS:", _dump(_clip_streams(runtime_data)), "",
+        "RETURN ONLY THE FIXED CODE:",
+    ))
+
+def build_fix_explain_prompt(code: str, ast_data: dict, runtime_data: dict) -> str:
+    """Build a prompt asking for the fixed code and an explanation in one JSON reply."""
+    return "\n".join((
+        "You are an expert Python debugger. Fix all bugs in the code below and explain the fixes.",
+        'Return ONLY a JSON object with two string keys: "fixed_code" (the corrected Python code) '
+        'and "explanation" (concise bullet points describing each bug and its fix).',
+        "",
+        "CODE:", code, "",
+        "AST ANALYSIS:", _dump(ast_data), "",
+        "RUNTIME ANALYSIS:", _dump(_clip_streams(runtime_data)), "",
+        "JSON:",
+    ))
+
+def parse_fix_explain(text: str) -> tuple:
+    """Split a combined fix/explain reply into (fixed_code, explanation)."""
+    m = _JSON_OBJ.search(text)
+    for candidate in (text, m.group(0) if m else None):
+        try:
+            data = json.loads(candidate) if candidate else None
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            explanation = data.get("explanation", "")
+            if isinstance(explanation, list):
+                explanation = "\n".join(f"- {item}" for item in explanation)
+            return str(data.get("fixed_code", "")).strip(), str(explanation).strip()
+
+    # Not JSON at all: first code block is the fix, the rest is the explanation
+    m = _CODE_FENCE.search(text)
+    if not m:
+        return text.strip(), ""
+    return m.group(1).strip(), (text[:m.start()] + text[m.end():]).strip()
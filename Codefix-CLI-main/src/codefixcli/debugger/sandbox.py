@@ -1,46 +1,180 @@
 import subprocess
 import sys
-import tempfile
+import marshal
+import traceback
 import os
+import signal
+import threading
 import time
 
-def run_in_sandbox(code: str, timeout: int = 5) -> dict:
-    fd, path = tempfile.mkstemp(suffix=".py")
-    os.close(fd)
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(code)
+# Loader run by the spare interpreter: read the marshalled (code, source) pair
+# from stdin, then run it as a real __main__ module (so __file__, sys.argv and
+# pickling of classes it defines behave like a script), with the source
+# registered so tracebacks still show the lines. The snippet is compiled by us,
+# so the child never parses it.
+_BOOT = """\
+import sys, types, linecache, marshal
+data = sys.stdin.buffer.read()
+if not data:
+    sys.exit()
+co, src = marshal.loads(data)
+linecache.cache["<sandbox>"] = (len(src), None, src.splitlines(True), "<sandbox>")
+main = types.ModuleType("__main__")
+main.__file__ = "<sandbox>"
+sys.modules["__main__"] = main
+sys.argv = ["<sandbox>"]
+try:
+    exec(co, main.__dict__)
+except SystemExit:
+    raise
+except BaseException:
+    import traceback
+    t, v, tb = sys.exc_info()
+    traceback.print_exception(t, v, tb.tb_next)
+    sys.exit(1)
+"""
+
+# Per-stream cap on captured output (bytes); a runaway print loop is killed once it's hit
+_MAX_OUTPUT = 1 << 20
+_CHUNK = 65536
+
+_spare = None
+_spare_lock = threading.Lock()
 
+def _spawn() -> subprocess.Popen:
     # Windows-safe process group flag
     _extra = {}
     if sys.platform == "win32":
         _extra["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
     else:
-        _extra["preexec_fn"] = os.setsid
+        _extra["start_new_session"] = True
+
+    return subprocess.Popen(
+        [sys.executable, "-c", _BOOT],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        # Pipes stay binary; make the child's side of them UTF-8 on every platform
+        env={**os.environ, "PYTHONIOENCODING": "utf-8"},
+        **_extra,
+    )
+
+def _take_interpreter() -> subprocess.Popen:
+    # Hand out the interpreter that booted during the previous run and start
+    # the next one now, so its startup overlaps with the user reading results.
+    # An idle spare exits on its own when we do: its stdin hits EOF.
+    global _spare
+    with _spare_lock:
+        proc = _spare if _spare is not None and _spare.poll() is None else _spawn()
+        try:
+            _spare = _spawn()
+        except OSError:
+            _spare = None
+    return proc
 
+def decode_output(data) -> str:
+    """Decode raw sandbox output for display or prompts, replacing invalid UTF-8."""
+    return data.decode("utf-8", errors="replace") if isinstance(data, bytes) else data
+
+def _kill_tree(proc: subprocess.Popen) -> None:
+    # Take down the whole process group, not just the leader, so grandchildren
+    # can't keep the pipes open past the timeout
     try:
+        if sys.platform == "win32":
+            subprocess.run(
+                ["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except (OSError, subprocess.SubprocessError):
+        proc.kill()
+
+class _Capture:
+    """Drain a child's stdout and stderr on two threads, keeping at most _MAX_OUTPUT of each."""
+
+    def __init__(self, proc: subprocess.Popen):
+        self.stdout, self.stderr = [], []
+        self.overrun = False
+        # Set once both streams hit EOF, or as soon as either one overruns
+        self.finished = threading.Event()
+        self._open = 2
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._drain, args=(stream, buf), daemon=True)
+            for stream, buf in ((proc.stdout, self.stdout), (proc.stderr, self.stderr))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def join(self, timeout: float) -> None:
+        # Once the child is dead its pipes hit EOF, so this only waits for the last reads
+        for t in self._threads:
+            t.join(timeout)
+
+    def _drain(self, stream, buf: list) -> None:
+        size = 0
+        while True:
+            chunk = stream.read(_CHUNK)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > _MAX_OUTPUT:
+                buf.append(chunk[:len(chunk) - (size - _MAX_OUTPUT)])
+                self.overrun = True
+                self.finished.set()
+                break
+            buf.append(chunk)
+        with self._lock:
+            self._open -= 1
+            if not self._open:
+                self.finished.set()
+
+def run_in_sandbox(code: str, timeout: int = 5) -> dict:
+    try:
+        co = compile(code, "<sandbox>", "exec", dont_inherit=True)
+    except Exception as e:
+        # SyntaxError/ValueError, or MemoryError/RecursionError on pathological
+        # sources: same result the child would have produced, without starting it
+        err = "".join(traceback.format_exception_only(type(e), e))
+        return {"ok": True, "stdout": b"", "stderr": err.encode("utf-8"), "returncode": 1, "elapsed": 0}
+
+    try:
+        payload = marshal.dumps((co, code))
+        proc = _take_interpreter()
         t0 = time.perf_counter()
-        proc = subprocess.run(
-            [sys.executable, path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            timeout=timeout,
-            **_extra,
-        )
+        cap = _Capture(proc)
+        try:
+            proc.stdin.write(payload)
+            proc.stdin.close()
+        except OSError:
+            pass  # child already gone; its stderr says why
+
+        try:
+            if not cap.finished.wait(timeout):
+                raise subprocess.TimeoutExpired(proc.args, timeout)
+            if cap.overrun:
+                _kill_tree(proc)
+            # Pipes can close before the process exits, so still bound the wait
+            proc.wait(timeout=max(0, t0 + timeout - time.perf_counter()))
+        except subprocess.TimeoutExpired:
+            _kill_tree(proc)
+            proc.wait()
+            return {"ok": False, "timeout": True, "elapsed": timeout}
+        # Let the readers finish so nothing the child wrote lands after the marker
+        cap.join(1)
+        if cap.overrun:
+            cap.stderr.append(b"\n[sandbox] output exceeded %d bytes; process killed" % _MAX_OUTPUT)
+        # Raw bytes: callers decode only the slice they actually show
+        stdout, stderr = b"".join(cap.stdout), b"".join(cap.stderr)
         elapsed = time.perf_counter() - t0
         return {
             "ok": True,
-            "stdout": proc.stdout,
-            "stderr": proc.stderr,
+            "stdout": stdout,
+            "stderr": stderr,
             "returncode": proc.returncode,
             "elapsed": round(elapsed, 4),
         }
-    except subprocess.TimeoutExpired:
-        return {"ok": False, "timeout": True, "elapsed": timeout}
     except Exception as e:
         return {"ok": False, "error": str(e), "elapsed": 0}
-    finally:
-        try:
-            os.remove(path)
-        except Exception:
-            pass
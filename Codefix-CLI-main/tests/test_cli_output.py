@@ -0,0 +1,67 @@
+import asyncio
+import json
+import time
+
+from codefixcli import cli
+
+
+def _fix_explain(monkeypatch, reply):
+    monkeypatch.setattr(cli, "ask_ollama_ping", lambda: None)
+    monkeypatch.setattr(cli, "ask_ollama", reply)
+
+    async def run():
+        app = cli.CodeFixApp()
+        async with app.run_test() as pilot:
+            app._input.text = "x = 1"
+            await pilot.click("#fix_explain")
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            return cli._plain(app._last_output)
+
+    return asyncio.run(run())
+
+
+def test_fix_explain_keeps_brackets(monkeypatch):
+    reply = json.dumps({"fixed_code": "arr = [1]\nprint(arr[i])", "explanation": "- a[/b] was wrong"})
+    out = _fix_explain(monkeypatch, lambda *a, **k: reply)
+    assert "arr = [1]\nprint(arr[i])" in out
+    assert "a[/b]" in out
+
+
+def test_fix_explain_error_keeps_brackets(monkeypatch):
+    def boom(*a, **k):
+        raise RuntimeError("bad reply a[/b]")
+
+    out = _fix_explain(monkeypatch, boom)
+    assert "bad reply a[/b]" in out
+
+
+def test_explain_keeps_brackets(monkeypatch):
+    monkeypatch.setattr(cli, "ask_ollama_ping", lambda: None)
+    monkeypatch.setattr(cli, "ask_ollama_stream", lambda prompt: iter(["- `arr[i]` reads ", "item i"]))
+
+    async def run():
+        app = cli.CodeFixApp()
+        async with app.run_test() as pilot:
+            app._input.text = "print(arr[i])"
+            await pilot.click("#explain")
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            return cli._plain(app._last_output)
+
+    assert asyncio.run(run()) == "- `arr[i]` reads item i"
+
+
+def test_quit_not_held_up_by_slow_warmup(monkeypatch):
+    # A cold model load can keep the ping open for up to timeout_sec
+    monkeypatch.setattr(cli, "ask_ollama_ping", lambda: time.sleep(8))
+
+    async def run():
+        app = cli.CodeFixApp()
+        async with app.run_test() as pilot:
+            await pilot.pause()
+            app.exit()
+
+    t0 = time.monotonic()
+    asyncio.run(run())
+    assert time.monotonic() - t0 < 4
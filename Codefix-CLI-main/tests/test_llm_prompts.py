@@ -1,4 +1,4 @@
-from codefixcli.debugger.llm import build_prompt
+from codefixcli.debugger.llm import build_prompt, build_fix_explain_prompt, parse_fix_explain
 
 def test_fix_prompt():
     code = "print('hello')"
@@ -7,3 +7,31 @@ def test_fix_prompt():
     prompt = build_prompt(code, ast_data, run_data)
     assert "print('hello')" in prompt
     assert "LLM" in prompt or "CODEFIX" in prompt
+
+def test_fix_explain_prompt():
+    prompt = build_fix_explain_prompt("print('hello')", {"issues": []}, {"stdout": "hello"})
+    assert "print('hello')" in prompt
+    assert "fixed_code" in prompt and "explanation" in prompt
+
+def test_parse_fix_explain_json():
+    fixed, explanation = parse_fix_explain('Sure: {"fixed_code": "x = 1", "explanation": "- typo"}')
+    assert fixed == "x = 1"
+    assert explanation == "- typo"
+
+def test_parse_fix_explain_fallback():
+    fixed, explanation = parse_fix_explain("Fixed:\n```python\nx = 1\n```\nThe name was misspelled.")
+    assert fixed == "x = 1"
+    assert "misspelled" in explanation
+
+def test_prompt_truncates_runtime_output():
+    prompt = build_prompt("print('x' * 10**6)", {"issues": []}, {"stdout": "x" * 10**6, "returncode": 0})
+    assert len(prompt) < 10_000
+    assert "chars truncated" in prompt
+
+def test_prompt_truncates_sandbox_bytes():
+    # run_in_sandbox returns raw bytes; only the kept head/tail get decoded
+    stdout = "é".encode("utf-8") * 10**5
+    prompt = build_prompt("print('é' * 10**5)", {"issues": []}, {"stdout": stdout, "stderr": b"", "returncode": 0})
+    assert len(prompt) < 10_000
+    assert "bytes truncated" in prompt
+    assert "b'" not in prompt and "éé" in prompt
@@ -0,0 +1,32 @@
+from codefixcli.debugger import llm
+
+
+class _Reply:
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"response": "ok"}
+
+    def iter_lines(self):
+        yield b'{"response": "ok", "done": true}'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def test_generate_calls_share_keep_alive(monkeypatch):
+    # Ollama applies keep_alive per request, so every call must send it,
+    # not only the warm-up ping
+    payloads = []
+    monkeypatch.setattr(llm.requests, "post", lambda url, json, **kw: payloads.append(json) or _Reply())
+
+    llm.ask_ollama_ping()
+    llm.ask_ollama("hi")
+    list(llm.ask_ollama_stream("hi"))
+
+    assert len(payloads) == 3
+    assert len({p["keep_alive"] for p in payloads}) == 1
@@ -0,0 +1,98 @@
+import sys
+import time
+
+import pytest
+
+from codefixcli.debugger import sandbox
+from codefixcli.debugger.sandbox import run_in_sandbox
+
+posix_only = pytest.mark.skipif(sys.platform == "win32", reason="POSIX process groups / signals")
+
+
+def _running(pid):
+    # A killed grandchild may linger as a zombie until something reaps it
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_output_is_bytes():
+    res = run_in_sandbox("import sys\nprint('hé')\nsys.stderr.write('oops')")
+    assert res["ok"] and res["returncode"] == 0
+    assert res["stdout"] == "hé\n".encode("utf-8")
+    assert res["stderr"] == b"oops"
+
+
+def test_main_module_semantics():
+    code = (
+        "import sys, pickle\n"
+        "class A: pass\n"
+        "pickle.dumps(A())\n"
+        "assert sys.modules['__main__'].A is A\n"
+        "print(__name__, __file__ == sys.argv[0])\n"
+    )
+    res = run_in_sandbox(code)
+    assert res["stderr"] == b""
+    assert res["stdout"] == b"__main__ True\n"
+
+
+def test_traceback_shows_source_lines():
+    res = run_in_sandbox("def f():\n    1 / 0\nf()")
+    assert res["returncode"] == 1
+    assert b"1 / 0" in res["stderr"] and b"ZeroDivisionError" in res["stderr"]
+
+
+def test_syntax_error_skips_child(monkeypatch):
+    def no_child():
+        raise AssertionError("interpreter should not be started")
+
+    monkeypatch.setattr(sandbox, "_take_interpreter", no_child)
+    res = run_in_sandbox("x = (")
+    assert res["ok"] and res["returncode"] == 1
+    assert b"SyntaxError" in res["stderr"]
+
+
+def test_compile_failure_still_returns_result():
+    # The parser gives up on this with MemoryError rather than SyntaxError
+    res = run_in_sandbox("x = " + "-" * 200000 + "1")
+    assert res["ok"] and res["returncode"] == 1
+    assert b"Error" in res["stderr"]
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs /proc")
+def test_timeout_kills_grandchildren(tmp_path):
+    pid_file = tmp_path / "pid"
+    code = (
+        "import subprocess, sys, time\n"
+        "p = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+        f"open({str(pid_file)!r}, 'w').write(str(p.pid))\n"
+        "time.sleep(60)\n"
+    )
+    t0 = time.monotonic()
+    res = run_in_sandbox(code, timeout=2)
+    assert res == {"ok": False, "timeout": True, "elapsed": 2}
+    assert time.monotonic() - t0 < 5
+
+    pid = int(pid_file.read_text())
+    deadline = time.monotonic() + 2
+    while _running(pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not _running(pid)
+
+
+@posix_only
+def test_output_flood_is_capped():
+    code = (
+        "import sys\n"
+        "sys.stderr.write('WARN-before-flood\\n')\n"
+        "sys.stderr.flush()\n"
+        "while True:\n"
+        "    print('y' * 1000)\n"
+    )
+    res = run_in_sandbox(code, timeout=10)
+    assert res["returncode"] == -9
+    assert len(res["stdout"]) == sandbox._MAX_OUTPUT
+    assert res["stderr"].startswith(b"WARN-before-flood\n")
+    assert res["stderr"].endswith(b"output exceeded %d bytes; process killed" % sandbox._MAX_OUTPUT)
@@ -5,23 +5,33 @@ from textual.widgets import Static, Button, TextArea, Footer, Select, Label
 from textual.containers import Vertical, Horizontal, ScrollableContainer
 from textual import work
 from rich.text import Text
-import pyperclip
-import traceback
 import re
 import os
-import datetime
+import time
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 from debugger import (
     scan,
     run_in_sandbox,
+    decode_output,
     build_prompt,
+    build_fix_code_prompt,
     ask_ollama,
+    ask_ollama_stream,
+    ask_ollama_ping,
+    build_fix_explain_prompt,
+    parse_fix_explain,
     extract_unified_diff,
     apply_patch,
 )
 
 # ── Settings ──────────────────────────────────────────────────────────────────
 import tomli as _tomli
+from functools import lru_cache
+@lru_cache(maxsize=1)
 def _load_cfg():
     path = os.path.join(os.path.dirname(__file__), "settings.toml")
     try:
@@ -30,6 +40,13 @@ def _load_cfg():
     except Exception:
         return {}
 
+@lru_cache(maxsize=1)
+def _clipboard():
+    # Same one-time probe pyperclip's lazy copy/paste stubs do, made explicit:
+    # detect the backend (xclip/xsel/wl-paste…) on first use and keep the pair
+    import pyperclip
+    return pyperclip.determine_clipboard()
+
 # ── Logo ──────────────────────────────────────────────────────────────────────
 LOGO = [
     "██████╗ ██████╗ ██████╗ ███████╗███████╗██╗██╗  ██╗     ██████╗██╗     ██╗",
@@ -49,19 +66,109 @@ LANGUAGES = [
 ]
 
 MAX_HISTORY = 5
+MAX_HISTORY_BYTES = 512 * 1024
+MAX_ANALYSIS_CACHE = 8
+
+# Rich markup tags, stripped before copying/saving output
+_MARKUP_RE = re.compile(r"\[/?[a-zA-Z0-9_ #/=]+\]")
+# Minimum seconds between output repaints while an LLM reply streams in (~30 Hz)
+_STREAM_INTERVAL = 1 / 30
+
+# ── LLM replies ───────────────────────────────────────────────────────────────
+def _first_code_block(text: str) -> str:
+    """Body of the first ``` fence (minus a python tag), or the whole reply if unfenced."""
+    i = text.find("```")
+    k = text.find("```", i + 3) if i >= 0 else -1
+    if k < 0:
+        return text.strip()
+    body = text[i + 3:k]
+    if body.startswith("python"):
+        body = body[6:]
+    return body.strip()
+
+# ── Analyze report ────────────────────────────────────────────────────────────
+_TAIL = 4000  # max bytes of sandbox output (chars of LLM text) shown in the panel
+
+def _tail(s) -> str:
+    """Keep only the last _TAIL bytes (sandbox) or chars (LLM text) so huge outputs don't swamp the layout."""
+    # A bytes cut can land mid-character; that decodes as a leading U+FFFD
+    if len(s) <= _TAIL:
+        return decode_output(s)
+    return "…[truncated]…\n" + decode_output(s[-_TAIL:])
+
+# Report lines are built as styled Text, never as markup, so program output
+# like `a[i]` is shown verbatim and Rich has no markup to parse
+_PURPLE = "bold #9370db"
+_LILAC  = "bold #cba6f7"
+
+_HDR_ANALYSIS   = Text("=== CODE ANALYSIS ===", style=_PURPLE)
+_HDR_AST        = Text.assemble("\n", ("▸ AST ANALYSIS", _LILAC))
+_HDR_COMPLEXITY = Text.assemble("\n", ("▸ COMPLEXITY", _LILAC))
+_HDR_RUNTIME    = Text.assemble("\n", ("▸ RUNTIME ANALYSIS", _LILAC))
+_HDR_FIX        = Text("=== FIXED CODE ===", style=_PURPLE)
+_HDR_EXPLAIN    = Text("=== EXPLANATION ===", style=_PURPLE)
+_HDR_CODE_EXPL  = Text("=== CODE EXPLANATION ===", style=_PURPLE)
+
+def _render_analyze(ast_res: dict, run_res: dict):
+    """Yield the lines of the Analyze report as Text."""
+    yield _HDR_ANALYSIS
+
+    # ── AST section ───────────────────────────────────────────────────────────
+    yield _HDR_AST
+    if ast_res.get("ok"):
+        issues = ast_res.get("issues", [])
+        if issues:
+            for iss in issues:
+                yield Text.assemble(
+                    ("  ⚠", "yellow"), f" {iss['message']}  ",
+                    (f"(line {iss.get('lineno', '?')})", "dim"),
+                )
+        else:
+            yield Text("  ✓ No issues found", style="green")
+    else:
+        err = ast_res.get("syntax_error", {})
+        yield Text(
+            f"  ✗ Syntax Error: {err.get('msg', 'Unknown')} (line {err.get('lineno', '?')})",
+            style="red",
+        )
+
+    # ── Complexity section ────────────────────────────────────────────────────
+    complexity = ast_res.get("complexity", {})
+    if complexity:
+        yield _HDR_COMPLEXITY
+        for fn, score in complexity.items():
+            bar = "█" * min(score, 20)
+            colour = "green" if score < 5 else ("yellow" if score < 10 else "red")
+            yield Text.assemble(f"  {fn}(): ", (f"{bar} {score}", colour))
+
+    # ── Runtime section ───────────────────────────────────────────────────────
+    yield _HDR_RUNTIME
+    if run_res.get("ok"):
+        yield Text.assemble(
+            (f"  ✓ Return code: {run_res.get('returncode', 0)}", "green"), "  ",
+            (f"⏱ {run_res.get('elapsed', 0)}s", "dim"),
+        )
+        if run_res.get("stdout"):
+            yield Text.assemble(("  stdout:", "dim"), "\n", _tail(run_res["stdout"].strip()))
+        if run_res.get("stderr"):
+            yield Text(f"  stderr:\n{_tail(run_res['stderr'].strip())}", style="red")
+    elif run_res.get("timeout"):
+        yield Text("  ✗ Timeout during execution", style="red")
+    else:
+        yield Text(f"  ✗ {run_res.get('error', 'Unknown error')}", style="red")
+
+def _error_text(e: Exception) -> Text:
+    """Error panel for a failed worker; the message is never parsed as markup."""
+    import traceback
+    return Text.assemble(("Error:", "red"), f"\n{e}\n\n{traceback.format_exc()}")
+
+def _plain(out) -> str:
+    """Unstyled form of a panel output, for the clipboard and saved files."""
+    return out.plain if isinstance(out, Text) else _MARKUP_RE.sub("", out)
 
 # ── Logo widget ───────────────────────────────────────────────────────────────
-class LogoWidget(Static):
-    def render(self):
-        t = Text()
-        for line in LOGO:
-            for char in line:
-                if char != ' ':
-                    t.append(char, style="bold #9370db")
-                else:
-                    t.append(char)
-            t.append("\n")
-        return t
+# One style span over the whole block; spaces carry no visible colour anyway
+_LOGO_TEXT = Text("\n".join(LOGO) + "\n", style="bold #9370db")
 
 
 # ── Main app ──────────────────────────────────────────────────────────────────
@@ -167,16 +274,29 @@ class CodeFixApp(App):
     """
 
     # ── State ─────────────────────────────────────────────────────────────────
-    _history: list[str] = []
     _hist_idx: int = -1
-    _last_output: str = ""
+    _last_output = ""  # markup str or Text
+    _last_status: str = ""
+    _shown_output = None
     _current_lang: str = "python"
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._history: deque = deque()
+        self._history_hashes: set = set()
+        self._history_bytes: int = 0
+        # Actions whose worker is still running
+        self._busy: set = set()
+        # blake2b(code) -> (ast_res, run_res), least recently used first
+        self._analysis_cache: OrderedDict = OrderedDict()
+        # Sandbox runs off the worker thread so scan() can overlap with it
+        self._pool = ThreadPoolExecutor(max_workers=2)
+
     def compose(self) -> ComposeResult:
         cfg = _load_cfg()
         model = cfg.get("model", "qwen2.5-coder:0.5b")
 
-        yield LogoWidget(id="logo")
+        yield Static(_LOGO_TEXT, id="logo")
         yield Static("CODEFIX CLI  v2.0", id="subtitle")
         yield Static("Paste code → Analyze / Fix / Explain", id="info")
 
@@ -201,6 +321,7 @@ class CodeFixApp(App):
             yield Button("Analyze",      id="analyze",      variant="primary")
             yield Button("Fix",          id="fix",          variant="success")
             yield Button("Explain",      id="explain",      variant="default")
+            yield Button("Fix & Explain", id="fix_explain", variant="success")
             yield Button("Copy Output",  id="copy_output",  variant="default")
             yield Button("Save",         id="save",         variant="default")
             yield Button("Paste",        id="paste",        variant="default")
@@ -212,24 +333,78 @@ class CodeFixApp(App):
         yield Static(f"  Model: {model}  │  Ready", id="status_bar")
         yield Footer()
 
+    def on_mount(self) -> None:
+        self._input  = self.query_one("#input", TextArea)
+        self._output = self.query_one("#output", Static)
+        self._status = self.query_one("#status_bar", Static)
+        self._warmup()
+
     # ── Helpers ───────────────────────────────────────────────────────────────
     def _set_status(self, msg: str):
         cfg = _load_cfg()
         model = cfg.get("model", "qwen2.5-coder:0.5b")
-        self.query_one("#status_bar", Static).update(f"  Model: {model}  │  {msg}")
+        status = f"  Model: {model}  │  {msg}"
+        if status == self._last_status:
+            return
+        self._last_status = status
+        self._status.update(status)
 
-    def _set_output(self, text: str):
-        self._last_output = text
-        self.query_one("#output", Static).update(text)
+    def _set_output(self, out, shown=None):
+        """Record `out` for Copy/Save and display it, or the shorter `shown` if given."""
+        self._last_output = out
+        self._show_output(out if shown is None else shown)
+
+    def _show_output(self, renderable):
+        """Put a renderable in the output panel, skipping the repaint if it is already shown."""
+        if renderable == self._shown_output:
+            return
+        self._shown_output = renderable
+        self._output.update(renderable)
+
+    def _stream_llm(self, prompt: str, header: Text) -> str:
+        """Stream an LLM reply into the output panel as it arrives; returns the full reply."""
+        # Partial replies are shown as plain Text under the same header the
+        # final output uses, so half-received tokens never go through markup.
+        chunks = []
+        last = 0.0
+        for chunk in ask_ollama_stream(prompt):
+            chunks.append(chunk)
+            now = time.monotonic()
+            if now - last >= _STREAM_INTERVAL:
+                last = now
+                self.call_from_thread(self._show_output, Text.assemble(header, "\n\n", "".join(chunks)))
+        return "".join(chunks)
+
+    def _analyze(self, code: str):
+        """Scan and sandbox the code, reusing results for any of the last few inputs."""
+        key = hashlib.blake2b(code.encode("utf-8"), digest_size=16).digest()
+        hit = self._analysis_cache.pop(key, None)
+        if hit is None:
+            # The AST walk runs here while the sandbox child starts up
+            fut_run = self._pool.submit(run_in_sandbox, code)
+            hit = scan(code), fut_run.result()
+        self._analysis_cache[key] = hit
+        while len(self._analysis_cache) > MAX_ANALYSIS_CACHE:
+            self._analysis_cache.popitem(last=False)
+        return hit
 
     def _push_history(self, code: str):
         if not code.strip():
             return
-        if self._history and self._history[-1] == code:
+        h = hash(code)
+        if h in self._history_hashes and code in self._history:
+            return
+        size = len(code.encode("utf-8"))
+        if size > MAX_HISTORY_BYTES:
             return
         self._history.append(code)
-        if len(self._history) > MAX_HISTORY:
-            self._history.pop(0)
+        self._history_hashes.add(h)
+        self._history_bytes += size
+        # Bound the buffer by entry count and by total size
+        while len(self._history) > MAX_HISTORY or self._history_bytes > MAX_HISTORY_BYTES:
+            old = self._history.popleft()
+            self._history_hashes.discard(hash(old))
+            self._history_bytes -= len(old.encode("utf-8"))
         self._hist_idx = len(self._history) - 1
 
     # ── Language selector ─────────────────────────────────────────────────────
@@ -237,7 +412,7 @@ class CodeFixApp(App):
         if event.select.id == "lang_select":
             lang = event.value
             self._current_lang = lang
-            ta = self.query_one("#input", TextArea)
+            ta = self._input
             try:
                 if lang:
                     ta.language = lang
@@ -255,23 +430,22 @@ class CodeFixApp(App):
 
         elif bid == "paste":
             try:
-                text = pyperclip.paste()
-                self.query_one("#input", TextArea).text = text
+                text = _clipboard()[1]()
+                self._input.text = text
                 self._set_status("Pasted from clipboard")
             except Exception:
                 self._set_output("[red]Could not paste from clipboard[/red]")
 
         elif bid == "clear":
-            self.query_one("#input", TextArea).text = ""
+            self._input.text = ""
             self._set_output("")
             self._set_status("Cleared")
 
         elif bid == "copy_output":
             if self._last_output:
-                # Strip rich markup tags for clipboard
-                clean = re.sub(r"\[/?[a-zA-Z0-9_ #/=]+\]", "", self._last_output)
+                clean = _plain(self._last_output)
                 try:
-                    pyperclip.copy(clean)
+                    _clipboard()[0](clean)
                     self._set_status("Output copied to clipboard ✓")
                 except Exception:
                     self._set_status("Could not copy — clipboard unavailable")
@@ -281,20 +455,19 @@ class CodeFixApp(App):
         elif bid == "save":
             self._save_output()
 
-        elif bid == "analyze":
-            code = self.query_one("#input", TextArea).text
-            self._push_history(code)
-            self.run_analyze()
-
-        elif bid == "fix":
-            code = self.query_one("#input", TextArea).text
-            self._push_history(code)
-            self.run_fix()
-
-        elif bid == "explain":
-            code = self.query_one("#input", TextArea).text
-            self._push_history(code)
-            self.run_explain()
+        elif bid in ("analyze", "fix", "explain", "fix_explain"):
+            # One run per action at a time; the worker releases it when it ends
+            if bid in self._busy:
+                self._set_status("Still working on the previous request…")
+                return
+            self._busy.add(bid)
+            self._push_history(self._input.text)
+            {
+                "analyze": self.run_analyze,
+                "fix": self.run_fix,
+                "explain": self.run_explain,
+                "fix_explain": self.run_fix_and_explain,
+            }[bid]()
 
         elif bid == "hist_prev":
             self._history_navigate(-1)
@@ -308,7 +481,7 @@ class CodeFixApp(App):
             self._set_status("History is empty")
             return
         self._hist_idx = max(0, min(len(self._history) - 1, self._hist_idx + direction))
-        self.query_one("#input", TextArea).text = self._history[self._hist_idx]
+        self._input.text = self._history[self._hist_idx]
         self._set_status(f"History [{self._hist_idx + 1}/{len(self._history)}]")
 
     # ── Save output ───────────────────────────────────────────────────────────
@@ -316,8 +489,9 @@ class CodeFixApp(App):
         if not self._last_output:
             self._set_status("Nothing to save yet")
             return
-        clean = re.sub(r"\[/?[a-zA-Z0-9_ #/=]+\]", "", self._last_output)
-        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        clean = _plain(self._last_output)
+        from datetime import datetime
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         desktop = os.path.join(os.path.expanduser("~"), "Desktop")
         os.makedirs(desktop, exist_ok=True)
         path = os.path.join(desktop, f"codefix_output_{stamp}.py")
@@ -328,124 +502,100 @@ class CodeFixApp(App):
         except Exception as e:
             self._set_status(f"Save failed: {e}")
 
+    # ── Model warm-up ─────────────────────────────────────────────────────────
+    def _warmup(self):
+        # Load the model while the user is still typing so the first Fix isn't cold.
+        # A daemon thread rather than a @work worker: Textual joins its workers on
+        # exit, so a slow cold-model ping would otherwise hold up Quit.
+        def ping():
+            try:
+                ask_ollama_ping()
+            except Exception:
+                pass
+
+        threading.Thread(target=ping, name="ollama-warmup", daemon=True).start()
+
     # ── Analyze ───────────────────────────────────────────────────────────────
     @work(thread=True)
     def run_analyze(self):
         self.call_from_thread(self._set_status, "Analyzing…")
-        self.call_from_thread(
-            self.query_one("#output", Static).update,
-            "[#9370db]Analyzing code…[/#9370db]"
-        )
+        self.call_from_thread(self._show_output, "[#9370db]Analyzing code…[/#9370db]")
         try:
-            code = self.query_one("#input", TextArea).text
-            ast_res  = scan(code)
-            run_res  = run_in_sandbox(code)
-
-            parts = ["[bold #9370db]=== CODE ANALYSIS ===[/bold #9370db]"]
-
-            # ── AST section ───────────────────────────────────────────────────
-            parts.append("\n[bold #cba6f7]▸ AST ANALYSIS[/bold #cba6f7]")
-            if ast_res.get("ok"):
-                issues = ast_res.get("issues", [])
-                if issues:
-                    for iss in issues:
-                        ln = iss.get("lineno", "?")
-                        parts.append(f"  [yellow]⚠[/yellow] {iss['message']}  [dim](line {ln})[/dim]")
-                else:
-                    parts.append("  [green]✓ No issues found[/green]")
-            else:
-                err = ast_res.get("syntax_error", {})
-                parts.append(f"  [red]✗ Syntax Error: {err.get('msg', 'Unknown')} (line {err.get('lineno', '?')})[/red]")
-
-            # ── Complexity section ─────────────────────────────────────────────
-            complexity = ast_res.get("complexity", {})
-            if complexity:
-                parts.append("\n[bold #cba6f7]▸ COMPLEXITY[/bold #cba6f7]")
-                for fn, score in complexity.items():
-                    bar = "█" * min(score, 20)
-                    colour = "green" if score < 5 else ("yellow" if score < 10 else "red")
-                    parts.append(f"  {fn}(): [{colour}]{bar}[/{colour}] [{colour}]{score}[/{colour}]")
-
-            # ── Runtime section ───────────────────────────────────────────────
-            parts.append("\n[bold #cba6f7]▸ RUNTIME ANALYSIS[/bold #cba6f7]")
-            if run_res.get("ok"):
-                elapsed = run_res.get("elapsed", 0)
-                parts.append(f"  [green]✓ Return code: {run_res.get('returncode', 0)}[/green]  [dim]⏱ {elapsed}s[/dim]")
-                if run_res.get("stdout"):
-                    parts.append(f"  [dim]stdout:[/dim]\n{run_res['stdout'].strip()}")
-                if run_res.get("stderr"):
-                    parts.append(f"  [red]stderr:\n{run_res['stderr'].strip()}[/red]")
-            else:
-                if run_res.get("timeout"):
-                    parts.append("  [red]✗ Timeout during execution[/red]")
-                else:
-                    parts.append(f"  [red]✗ {run_res.get('error', 'Unknown error')}[/red]")
-
-            out = "\n".join(parts)
+            code = self._input.text
+            ast_res, run_res = self._analyze(code)
+            out = Text("\n").join(_render_analyze(ast_res, run_res))
             self.call_from_thread(self._set_output, out)
             self.call_from_thread(self._set_status, "Analysis complete ✓")
 
         except Exception as e:
-            err_text = f"[red]Error:[/red]\n{e}\n\n{traceback.format_exc()}"
-            self.call_from_thread(self._set_output, err_text)
+            self.call_from_thread(self._set_output, _error_text(e))
             self.call_from_thread(self._set_status, "Analysis failed")
+        finally:
+            self._busy.discard("analyze")
 
     # ── Fix ───────────────────────────────────────────────────────────────────
     @work(thread=True)
     def run_fix(self):
         self.call_from_thread(self._set_status, "Fixing with LLM…")
-        self.call_from_thread(
-            self.query_one("#output", Static).update,
-            "[#9370db]Fixing code with Qwen2.5…[/#9370db]"
-        )
+        self.call_from_thread(self._show_output, "[#9370db]Fixing code with Qwen2.5…[/#9370db]")
         try:
-            code    = self.query_one("#input", TextArea).text
-            ast_res = scan(code)
-            run_res = run_in_sandbox(code)
-
-            prompt = (
-                "You are an expert Python debugger. Fix all bugs in the code below.\n"
-                "Return ONLY the corrected Python code, nothing else.\n\n"
-                f"CODE:\n{code}\n\n"
-                f"AST ANALYSIS:\n{ast_res}\n\n"
-                f"RUNTIME ANALYSIS:\n{run_res}\n\n"
-                "RETURN ONLY THE FIXED CODE:"
-            )
-            llm_out = ask_ollama(prompt)
+            code    = self._input.text
+            ast_res, run_res = self._analyze(code)
+            llm_out = self._stream_llm(build_fix_code_prompt(code, ast_res, run_res), _HDR_FIX)
 
             # Extract code block
-            fixed = llm_out
-            for pattern in [r'```python\s*(.*?)```', r'```\s*(.*?)```']:
-                m = re.findall(pattern, llm_out, re.DOTALL)
-                if m:
-                    fixed = m[0]
-                    break
-            fixed = fixed.strip()
-
-            parts = [
-                "[bold #9370db]=== FIXED CODE ===[/bold #9370db]",
-                "",
-                fixed,
-            ]
-            out = "\n".join(parts)
-            self.call_from_thread(self._set_output, out)
+            fixed = _first_code_block(llm_out)
+
+            # Only the panel is truncated; Copy/Save get the whole fix
+            out = Text.assemble(_HDR_FIX, "\n\n", fixed)
+            shown = Text.assemble(_HDR_FIX, "\n\n", _tail(fixed))
+            self.call_from_thread(self._set_output, out, shown)
             self.call_from_thread(self._set_status, "Fix complete ✓")
 
         except Exception as e:
-            err_text = f"[red]Error:[/red]\n{e}\n\n{traceback.format_exc()}"
-            self.call_from_thread(self._set_output, err_text)
+            self.call_from_thread(self._set_output, _error_text(e))
             self.call_from_thread(self._set_status, "Fix failed")
+        finally:
+            self._busy.discard("fix")
+
+    # ── Fix & Explain ─────────────────────────────────────────────────────────
+    @work(thread=True)
+    def run_fix_and_explain(self):
+        self.call_from_thread(self._set_status, "Fixing and explaining with LLM…")
+        self.call_from_thread(self._show_output, "[#9370db]Fixing and explaining code with Qwen2.5…[/#9370db]")
+        try:
+            code = self._input.text
+            ast_res, run_res = self._analyze(code)
+
+            # One round-trip for both answers; leave room for the code and the prose
+            max_tokens = int(_load_cfg().get("max_tokens", 512))
+            llm_out = ask_ollama(
+                build_fix_explain_prompt(code, ast_res, run_res),
+                num_predict=2 * max_tokens,
+                json_format=True,
+            )
+            fixed, explanation = parse_fix_explain(llm_out)
+
+            out = Text.assemble(
+                _HDR_FIX, "\n\n", fixed, "\n\n",
+                _HDR_EXPLAIN, "\n\n", explanation or Text("No explanation returned.", style="dim"),
+            )
+            self.call_from_thread(self._set_output, out)
+            self.call_from_thread(self._set_status, "Fix & explain complete ✓")
+
+        except Exception as e:
+            self.call_from_thread(self._set_output, _error_text(e))
+            self.call_from_thread(self._set_status, "Fix & explain failed")
+        finally:
+            self._busy.discard("fix_explain")
 
     # ── Explain ───────────────────────────────────────────────────────────────
     @work(thread=True)
     def run_explain(self):
         self.call_from_thread(self._set_status, "Explaining with LLM…")
-        self.call_from_thread(
-            self.query_one("#output", Static).update,
-            "[#9370db]Explaining code with Qwen2.5…[/#9370db]"
-        )
+        self.call_from_thread(self._show_output, "[#9370db]Explaining code with Qwen2.5…[/#9370db]")
         try:
-            code = self.query_one("#input", TextArea).text
+            code = self._input.text
             if not code.strip():
                 self.call_from_thread(self._set_output, "[yellow]No code to explain.[/yellow]")
                 self.call_from_thread(self._set_status, "Nothing to explain")
@@ -458,21 +608,17 @@ class CodeFixApp(App):
                 f"CODE:\n{code}\n\n"
                 "EXPLANATION:"
             )
-            explanation = ask_ollama(prompt)
-
-            parts = [
-                "[bold #9370db]=== CODE EXPLANATION ===[/bold #9370db]",
-                "",
-                explanation.strip(),
-            ]
-            out = "\n".join(parts)
+            explanation = self._stream_llm(prompt, _HDR_CODE_EXPL)
+
+            out = Text.assemble(_HDR_CODE_EXPL, "\n\n", explanation.strip())
             self.call_from_thread(self._set_output, out)
             self.call_from_thread(self._set_status, "Explanation complete ✓")
 
         except Exception as e:
-            err_text = f"[red]Error:[/red]\n{e}\n\n{traceback.format_exc()}"
-            self.call_from_thread(self._set_output, err_text)
+            self.call_from_thread(self._set_output, _error_text(e))
             self.call_from_thread(self._set_status, "Explain failed")
+        finally:
+            self._busy.discard("explain")
 
 
 # ── Entry point ───────────────────────────────────────────────────────────────
@@ -1,14 +1,20 @@
 from .ast_scan import scan
-from .sandbox import run_in_sandbox
-from .llm import build_prompt, ask_ollama
+from .sandbox import run_in_sandbox, decode_output
+from .llm import build_prompt, build_fix_code_prompt, ask_ollama, ask_ollama_stream, ask_ollama_ping, build_fix_explain_prompt, parse_fix_explain
 from .patcher import extract_unified_diff, apply_patch
 from .reporter import build_llm_payload, print_report
 
 __all__ = [
     "scan",
     "run_in_sandbox",
+    "decode_output",
     "build_prompt",
+    "build_fix_code_prompt",
     "ask_ollama",
+    "ask_ollama_stream",
+    "ask_ollama_ping",
+    "build_fix_explain_prompt",
+    "parse_fix_explain",
     "extract_unified_diff",
     "apply_patch",
     "build_llm_payload",
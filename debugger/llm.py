@@ -3,66 +3,200 @@ import tomli
 import os
 import requests
 import json
+import re
+from functools import lru_cache
 
+from .sandbox import decode_output
+
+# First fenced code block, and the outermost {...}, in a reply that wasn't clean JSON
+_CODE_FENCE = re.compile(r"```(?:python)?\s*(.*?)```", re.DOTALL)
+_JSON_OBJ = re.compile(r"\{.*\}", re.DOTALL)
+
+@lru_cache(maxsize=1)
 def _load_settings():
     path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "settings.toml"))
     with open(path, "rb") as f:
         return tomli.load(f)
 
-def ask_ollama(prompt: str) -> str:
+def _ollama_cli(prompt: str, model: str, timeout: int) -> str:
+    cmd = ["ollama", "run", model]
+
+    proc = subprocess.run(
+        cmd,
+        input=prompt,
+        text=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=timeout,
+    )
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"Ollama error: {proc.stderr}")
+
+    out = proc.stdout or ""
+    out = out.replace("```python", "").replace("```diff", "")
+    out = out.replace("```", "")
+    return out.strip()
+
+def ask_ollama(prompt: str, num_predict: int = None, json_format: bool = False) -> str:
     cfg = _load_settings()
     model = cfg.get("model", "qwen2.5Coder:0.5b")
     timeout = int(cfg.get("timeout_sec", 40))
     host = cfg.get("ollama_host", "http://localhost:11434")
     
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": False,
+        "keep_alive": cfg.get("keep_alive", "30m"),
+        "options": {
+            "temperature": cfg.get("temperature", 0.0),
+            "num_predict": num_predict or cfg.get("max_tokens", 512)
+        }
+    }
+    if json_format:
+        payload["format"] = "json"
+
     # Try API method first (more reliable)
+    try:
+        response = requests.post(
+            f"{host}/api/generate",
+            json=payload,
+            timeout=timeout
+        )
+        response.raise_for_status()
+        result = response.json()
+        return result.get("response", "").strip()
+    except requests.exceptions.RequestException:
+        # Fallback to subprocess method
+        return _ollama_cli(prompt, model, timeout)
+
+def ask_ollama_stream(prompt: str):
+    cfg = _load_settings()
+    model = cfg.get("model", "qwen2.5Coder:0.5b")
+    timeout = int(cfg.get("timeout_sec", 40))
+    host = cfg.get("ollama_host", "http://localhost:11434")
+
     try:
         response = requests.post(
             f"{host}/api/generate",
             json={
                 "model": model,
                 "prompt": prompt,
-                "stream": False,
+                "stream": True,
+                "keep_alive": cfg.get("keep_alive", "30m"),
                 "options": {
                     "temperature": cfg.get("temperature", 0.0),
                     "num_predict": cfg.get("max_tokens", 512)
                 }
             },
-            timeout=timeout
+            timeout=timeout,
+            stream=True,
         )
         response.raise_for_status()
-        result = response.json()
-        return result.get("response", "").strip()
     except requests.exceptions.RequestException:
-        # Fallback to subprocess method
-        cmd = ["ollama", "run", model]
-
-        proc = subprocess.run(
-            cmd,
-            input=prompt,
-            text=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=timeout,
-        )
+        # The CLI fallback can't stream; hand back the whole reply at once
+        yield _ollama_cli(prompt, model, timeout)
+        return
+
+    # One JSON object per line: {"response": "<token>", "done": false}
+    with response:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("response"):
+                yield chunk["response"]
+            if chunk.get("done"):
+                break
+
+def ask_ollama_ping() -> None:
+    cfg = _load_settings()
+    model = cfg.get("model", "qwen2.5Coder:0.5b")
+    timeout = int(cfg.get("timeout_sec", 40))
+    host = cfg.get("ollama_host", "http://localhost:11434")
+
+    # No CLI fallback: a warm-up isn't worth spawning `ollama run` for
+    response = requests.post(
+        f"{host}/api/generate",
+        json={
+            "model": model,
+            "prompt": " ",
+            "stream": False,
+            # Every generate call sends this; Ollama resets it per request
+            "keep_alive": cfg.get("keep_alive", "30m"),
+            "options": {"num_predict": 1},
+        },
+        # Give up quickly if nothing is listening; loading the model may take a while
+        timeout=(2, timeout),
+    )
+    response.raise_for_status()
+
+def _trunc(s, head: int = 4096, tail: int = 2048) -> str:
+    # Sandbox output arrives as bytes; only the kept slices get decoded
+    if len(s) <= head + tail:
+        return decode_output(s)
+    unit = "bytes" if isinstance(s, bytes) else "chars"
+    return f"{decode_output(s[:head])}\n…[{len(s) - head - tail} {unit} truncated]…\n{decode_output(s[-tail:])}"
 
-        if proc.returncode != 0:
-            raise RuntimeError(f"Ollama error: {proc.stderr}")
+def _clip_streams(runtime_data: dict) -> dict:
+    # A runaway print loop shouldn't turn into a megabyte prompt
+    return {k: _trunc(v) if k in ("stdout", "stderr") and isinstance(v, (str, bytes)) else v
+            for k, v in runtime_data.items()}
 
-        out = proc.stdout or ""
-        out = out.replace("```python", "").replace("```diff", "")
-        out = out.replace("```", "")
-        return out.strip()
+def _dump(data: dict) -> str:
+    # JSON is both cheaper to produce than repr() and fewer tokens for the model
+    return json.dumps(data, default=str, ensure_ascii=False)
 
 def build_prompt(code: str, ast_data: dict, runtime_data: dict) -> str:
-    return (
-        "You are CODEFIX. Generate ONLY a unified diff patch.\n"
-        "No explanations. No comments. No markdown.\n\n"
-        "CODE:\n"
-        f"{code}\n\n"
-        "AST ANALYSIS:\n"
-        f"{ast_data}\n\n"
-        "RUNTIME ANALYSIS:\n"
-        f"{runtime_data}\n\n"
-        "Return ONLY unified diff patch:"
-    )
+    return "\n".join((
+        "You are CODEFIX. Generate ONLY a unified diff patch.",
+        "No explanations. No comments. No markdown.",
+        "",
+        "CODE:", code, "",
+        "AST ANALYSIS:", _dump(ast_data), "",
+        "RUNTIME ANALYSIS:", _dump(_clip_streams(runtime_data)), "",
+        "Return ONLY unified diff patch:",
+    ))
+
+def build_fix_code_prompt(code: str, ast_data: dict, runtime_data: dict) -> str:
+    return "\n".join((
+        "You are an expert Python debugger. Fix all bugs in the code below.",
+        "Return ONLY the corrected Python code, nothing else.",
+        "",
+        "CODE:", code, "",
+        "AST ANALYSIS:", _dump(ast_data), "",
+        "RUNTIME ANALYSIS:", _dump(_clip_streams(runtime_data)), "",
+        "RETURN ONLY THE FIXED CODE:",
+    ))
+
+def build_fix_explain_prompt(code: str, ast_data: dict, runtime_data: dict) -> str:
+    return "\n".join((
+        "You are an expert Python debugger. Fix all bugs in the code below and explain the fixes.",
+        'Return ONLY a JSON object with two string keys: "fixed_code" (the corrected Python code) '
+        'and "explanation" (concise bullet points describing each bug and its fix).',
+        "",
+        "CODE:", code, "",
+        "AST ANALYSIS:", _dump(ast_data), "",
+        "RUNTIME ANALYSIS:", _dump(_clip_streams(runtime_data)), "",
+        "JSON:",
+    ))
+
+def parse_fix_explain(text: str) -> tuple:
+    m = _JSON_OBJ.search(text)
+    for candidate in (text, m.group(0) if m else None):
+        try:
+            data = json.loads(candidate) if candidate else None
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            explanation = data.get("explanation", "")
+            if isinstance(explanation, list):
+                explanation = "\n".join(f"- {item}" for item in explanation)
+            return str(data.get("fixed_code", "")).strip(), str(explanation).strip()
+
+    # Not JSON at all: first code block is the fix, the rest is the explanation
+    m = _CODE_FENCE.search(text)
+    if not m:
+        return text.strip(), ""
+    return m.group(1).strip(), (text[:m.start()] + text[m.end():]).strip()
@@ -1,26 +1,21 @@
 import re
 
-def extract_unified_diff(text: str) -> str:
-    # Try ```diff fenced
-    m = re.search(r"```diff(.*?)```", text, re.DOTALL)
-    if m:
-        return m.group(1).strip()
+# ```diff / ``` fenced block
+_DIFF_FENCE = re.compile(r"```(?:diff)?(.*?)```", re.DOTALL)
+# First line that starts a bare (unfenced) diff
+_DIFF_START = re.compile(r"^(?:diff --|--- |@@)", re.MULTILINE)
 
-    # Try ``` fenced
-    m = re.search(r"```(?:diff)?(.*?)```", text, re.DOTALL)
+def extract_unified_diff(text: str) -> str:
+    # Try fenced block
+    m = _DIFF_FENCE.search(text)
     if m:
         return m.group(1).strip()
 
-    # Fallback scan
-    start = None
-    lines = text.splitlines()
-    for i, ln in enumerate(lines):
-        if ln.startswith("diff --") or ln.startswith("--- ") or ln.startswith("@@"):
-            start = i
-            break
-    if start is None:
+    # Fallback: everything from the first diff header line onwards
+    m = _DIFF_START.search(text)
+    if not m:
         return ""
-    return "\n".join(lines[start:]).strip()
+    return text[m.start():].strip()
 
 def apply_patch(original: str, diff_text: str) -> str:
     if not diff_text.strip():